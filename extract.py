@@ -1,20 +1,36 @@
-import re
 import argparse
 import json
+import mmap
 from pathlib import Path
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 
-pattern = re.compile(r"\[fusion_builder_container[\s\S]*?\[/fusion_builder_container\]", re.MULTILINE)
+try:
+    # Optional: google-re2 gives linear-time matching on large pages.
+    import re2 as re
+except ImportError:
+    import re
+
+pattern = re.compile(r"\[fusion_builder_container[\s\S]*?\[/fusion_builder_container\]")
+bytes_pattern = re.compile(rb"\[fusion_builder_container[\s\S]*?\[/fusion_builder_container\]")
 
 def export_from_file(input_file: Path, output_dir: Path):
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    content = input_file.read_text(encoding="utf-8")
-    containers = pattern.findall(content)
+    # Containers are copied out as raw UTF-8 bytes straight from the mapped page,
+    # without decoding the whole page to str first.
+    if input_file.stat().st_size == 0:
+        return 0
 
-    for i, container in enumerate(containers, start=1):
-        (output_dir / f"container_{i}.txt").write_text(container, encoding="utf-8")
+    count = 0
+    with open(input_file, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for m in bytes_pattern.finditer(mm):
+                count += 1
+                with open(output_dir / f"container_{count}.txt", "wb") as out:
+                    out.write(mm[m.start():m.end()])
 
-    return len(containers)
+    return count
 
 def cmd_export(args):
     input_file = Path(args.input)
@@ -23,6 +39,15 @@ def cmd_export(args):
     count = export_from_file(input_file, out_dir)
     print(f"Exported {count} containers to folder '{out_dir}'.")
 
+def export_page(f: Path, src_dir: Path, out_root: Path):
+    rel_dir = f.parent.relative_to(src_dir)
+    rel_dir_str = "" if str(rel_dir) == "." else str(rel_dir)
+
+    page_dir = out_root / rel_dir_str / f.stem
+
+    count = export_from_file(f, page_dir)
+    return f, rel_dir_str, page_dir, count
+
 def cmd_batch_export(args):
     src_dir = Path(args.src)
     out_root = Path(args.out)
@@ -38,14 +63,10 @@ def cmd_batch_export(args):
     total_files = 0
     total_containers = 0
 
-    for f in files:
-        rel_dir = f.parent.relative_to(src_dir)
-        rel_dir_str = "" if str(rel_dir) == "." else str(rel_dir)
-
-        page_dir = out_root / rel_dir_str / f.stem
-
-        count = export_from_file(f, page_dir)
+    with ProcessPoolExecutor() as ex:
+        results = list(ex.map(export_page, files, repeat(src_dir), repeat(out_root), chunksize=32))
 
+    for f, rel_dir_str, page_dir, count in results:
         index.append({
             "source": str(f),
             "output": str(page_dir),
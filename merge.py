@@ -1,24 +1,53 @@
+import io
 import argparse
 import re
 from pathlib import Path
 
+from segments import iter_files
+
 NUM_RX = re.compile(r"container_(\d+)\.txt$")
 
 def container_index(p: Path) -> int:
     m = NUM_RX.search(p.name)
     return int(m.group(1)) if m else 10**9
 
-def merge_page_dir(page_dir: Path) -> str:
+def write_merged(parts, out):
+    # Writes "\n\n".join(parts).strip() + "\n" one part at a time: leading whitespace
+    # is dropped until the first non-blank part, and trailing whitespace is held back
+    # until more text follows, so the joined page never exists as one string.
+    pending = ""
+    started = False
+    for i, part in enumerate(parts):
+        if i:
+            pending += "\n\n"
+        core = part.strip()
+        if not core:
+            if started:
+                pending += part
+            continue
+        lead = part[:part.index(core)]
+        out.write(pending + lead + core if started else core)
+        pending = part[len(lead) + len(core):]
+        started = True
+    out.write("\n")
+
+def merge_containers(parts) -> str:
+    buf = io.StringIO()
+    write_merged(parts, buf)
+    return buf.getvalue()
+
+def merge_page_dir(page_dir: Path, out_file: Path):
     containers = sorted(page_dir.glob("container_*.txt"), key=container_index)
-    parts = [c.read_text(encoding="utf-8") for c in containers]
-    return "\n\n".join(parts).strip() + "\n"
+    with open(out_file, "w", encoding="utf-8") as out:
+        write_merged((c.read_text(encoding="utf-8") for c in containers), out)
 
-def main():
+def build_parser() -> argparse.ArgumentParser:
     ap = argparse.ArgumentParser()
     ap.add_argument("--src", default="applied", help="Folder with translated containers")
     ap.add_argument("--out", default="output", help="Output folder for merged .txt files")
-    args = ap.parse_args()
+    return ap
 
+def run(args: argparse.Namespace):
     src = Path(args.src)
     out = Path(args.out)
     out.mkdir(parents=True, exist_ok=True)
@@ -26,11 +55,12 @@ def main():
     if not src.exists():
         raise SystemExit(f"--src does not exist: {src}")
 
-    page_dirs = [p for p in src.rglob("*") if p.is_dir() and any(p.glob("container_*.txt"))]
+    # A page folder is any folder below src holding at least one container file.
+    page_dirs = sorted({p.parent for p in iter_files(src, "container_*.txt")} - {src})
     if not page_dirs:
         raise SystemExit(f"No page folders with container_*.txt in: {src}")
 
-    for page_dir in sorted(page_dirs):
+    for page_dir in page_dirs:
         rel = page_dir.relative_to(src)
 
         # output: .../<parent>/<page>.txt
@@ -41,9 +71,11 @@ def main():
             out_subdir.mkdir(parents=True, exist_ok=True)
             out_file = out_subdir / f"{rel.name}.txt"
 
-        merged = merge_page_dir(page_dir)
-        out_file.write_text(merged, encoding="utf-8")
+        merge_page_dir(page_dir, out_file)
         print(f"{page_dir} -> {out_file}")
 
+def main():
+    run(build_parser().parse_args())
+
 if __name__ == "__main__":
     main()
@@ -1,17 +1,46 @@
-import subprocess
 import sys
 import argparse
+import traceback
 from pathlib import Path
 from datetime import datetime
 
+import extract
+import segments
+import translate
+import merge
+
 SCRIPT_DIR = Path(__file__).resolve().parent
 
-def run(cmd):
-    print("\n▶", " ".join(cmd))
-    r = subprocess.run(cmd)
-    if r.returncode != 0:
+def run(label, func, *args):
+    print("\n▶", label)
+    try:
+        func(*args)
+    except SystemExit as e:
+        # Stages exit with a readable message for expected problems.
+        print(f"\n✖ Error, stopping pipeline: {e}")
+        sys.exit(1)
+    except Exception:
+        # Anything else is a bug; keep the traceback.
+        traceback.print_exc()
         print("\n✖ Error, stopping pipeline")
-        sys.exit(r.returncode)
+        sys.exit(1)
+
+def translate_args(args, in_dir: str, out_dir: str) -> argparse.Namespace:
+    # Parsed by translate's own parser, so options not set here keep translate's defaults.
+    argv = [
+        "--in", in_dir,
+        "--out", out_dir,
+        "--pattern", "container_*.json",
+        "--model", args.model,
+        "--lang", args.lang,
+        "--batch", str(args.batch),
+        "--workers", str(args.workers),
+    ]
+    if args.overwrite:
+        argv.append("--overwrite")
+    if args.pretty:
+        argv.append("--pretty")
+    return translate.build_parser().parse_args(argv)
 
 def main():
     ap = argparse.ArgumentParser()
@@ -21,6 +50,7 @@ def main():
     ap.add_argument("--workers", type=int, default=12)
     ap.add_argument("--batch", type=int, default=40)
     ap.add_argument("--overwrite", action="store_true")
+    ap.add_argument("--pretty", action="store_true", help="Indent extracted/ and translated/ JSON for reading")
     ap.add_argument("--job-name", help="Custom job name (default: auto-generated)")
     args = ap.parse_args()
 
@@ -40,58 +70,39 @@ def main():
     translated_containers_dir = str(job_dir / "applied")
     merged_pages_dir = str(job_dir / "output")
 
-    run([
-        "python3",
-        str(SCRIPT_DIR / "extract.py"),
-        "batch_export",
-        "--src", args.src,
-        "--out", export_dir,
-        "--print-each"
-    ])
+    run(
+        f"extract batch_export --src {args.src} --out {export_dir}",
+        extract.cmd_batch_export,
+        argparse.Namespace(src=args.src, out=export_dir, print_each=True),
+    )
     print("\n✔ Container export completed")
 
-    run([
-        "python3",
-        str(SCRIPT_DIR / "segments.py"),
-        "extract",
-        "--src", export_dir,
-        "--out", extracted_dir
-    ])
+    run(
+        f"segments extract --src {export_dir} --out {extracted_dir}",
+        segments.cmd_extract,
+        export_dir, extracted_dir, "container_*.txt", args.pretty,
+    )
     print("\n✔ Translation extraction completed")
 
-    cmd_translate = [
-        "python3",
-        str(SCRIPT_DIR / "translate.py"),
-        "--in", extracted_dir,
-        "--out", translated_json_dir,
-        "--lang", lang,
-        "--model", args.model,
-        "--workers", str(args.workers),
-        "--batch", str(args.batch),
-    ]
-    if args.overwrite:
-        cmd_translate.append("--overwrite")
-
-    run(cmd_translate)
+    run(
+        f"translate --in {extracted_dir} --out {translated_json_dir} --lang {lang}",
+        translate.run,
+        translate_args(args, extracted_dir, translated_json_dir),
+    )
     print("\n✔ OpenAI JSON translation completed")
 
-    run([
-        "python3",
-        str(SCRIPT_DIR / "segments.py"),
-        "apply",
-        "--src", export_dir,
-        "--extracted", extracted_dir,
-        "--translated", translated_json_dir,
-        "--out", translated_containers_dir
-    ])
+    run(
+        f"segments apply --src {export_dir} --out {translated_containers_dir}",
+        segments.cmd_apply,
+        export_dir, extracted_dir, translated_json_dir, translated_containers_dir, "container_*.txt",
+    )
     print("\n✔ Translated Fusion containers (.txt) generated")
 
-    run([
-        "python3",
-        str(SCRIPT_DIR / "merge.py"),
-        "--src", translated_containers_dir,
-        "--out", merged_pages_dir
-    ])
+    run(
+        f"merge --src {translated_containers_dir} --out {merged_pages_dir}",
+        merge.run,
+        merge.build_parser().parse_args(["--src", translated_containers_dir, "--out", merged_pages_dir]),
+    )
     print("\n✔ Pages merged back into original .txt structure")
 
     print(f"\n✔ ALL DONE → {merged_pages_dir}/")
@@ -0,0 +1,153 @@
+import argparse
+import os
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from openai import OpenAI
+
+import extract
+import segments
+import translate
+import merge
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+def dump_json(path: Path, payload: dict, pretty: bool):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    segments.write_json(path, payload, pretty)
+
+def process_page(client: OpenAI, page_file: Path, src_dir: Path, job_dir: Path, args):
+    rel = page_file.relative_to(src_dir)
+    out_path = job_dir / "output" / rel
+
+    if out_path.exists() and not args.overwrite:
+        return (str(rel), 0, 0, 0, 0, "skipped")
+
+    content = page_file.read_text(encoding="utf-8")
+
+    # Same keys as the on-disk pipeline (<page>/container_<n>.txt), so segment ids match.
+    # Only each container's span is kept; its text is sliced from content when needed,
+    # so no list of container substrings is held for the whole page.
+    page_key = rel.with_suffix("").as_posix()
+    items = []
+    for i, m in enumerate(extract.pattern.finditer(content), start=1):
+        source_key = f"{page_key}/container_{i}.txt"
+        segs = segments.extract_segments(content[m.start():m.end()], source_key)
+        items.append((source_key, m.start(), m.end(), segs))
+
+    if not items:
+        return (str(rel), 0, 0, 0, 0, "empty")
+
+    all_segs = [s for _, _, _, segs in items for s in segs]
+    tr_map = {}
+    page_in = 0
+    page_out = 0
+
+    for group in translate.chunk_list(all_segs, args.batch):
+        translated, usage = translate.translate_segments(
+            client=client,
+            model=args.model,
+            target_lang=args.lang,
+            segments=group,
+            max_retries=args.max_retries,
+            sleep_base=args.sleep_base,
+        )
+        for s in translated["segments"]:
+            tr_map[s["id"]] = s
+
+        if usage:
+            page_in += int(getattr(usage, "input_tokens", 0) or 0)
+            page_out += int(getattr(usage, "output_tokens", 0) or 0)
+
+    if args.debug_dump:
+        for source_key, _, _, segs in items:
+            json_rel = Path(source_key).with_suffix(".json")
+            dump_json(job_dir / "extracted" / json_rel, segments.extracted_payload(source_key, segs), args.pretty)
+            dump_json(job_dir / "translated" / json_rel, {
+                "source_key": source_key,
+                "hash_version": segments.HASH_VERSION,
+                "segments": [{"id": s["id"], "kind": s["kind"], "text": tr_map[s["id"]]["text"]} for s in segs],
+            }, args.pretty)
+
+    applied = (
+        segments.apply_translations(content[start:end], segs, tr_map, source_key)
+        for source_key, start, end, segs in items
+    )
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(merge.merge_containers(applied), encoding="utf-8")
+
+    return (str(rel), len(items), len(all_segs), page_in, page_out, "ok")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--src", default="content", help="Source folder with .txt files")
+    ap.add_argument("--lang", default="English", help="Target language for OpenAI translation")
+    ap.add_argument("--model", default="gpt-5-mini")
+    ap.add_argument("--workers", type=int, default=12)
+    ap.add_argument("--batch", type=int, default=40)
+    ap.add_argument("--max-retries", type=int, default=6)
+    ap.add_argument("--sleep-base", type=float, default=0.2)
+    ap.add_argument("--overwrite", action="store_true")
+    ap.add_argument("--job-name", help="Custom job name (default: auto-generated)")
+    ap.add_argument("--debug-dump", action="store_true", help="Also write extracted/ and translated/ JSON")
+    ap.add_argument("--pretty", action="store_true", help="Indent --debug-dump JSON for reading")
+    args = ap.parse_args()
+
+    if not os.getenv("OPENAI_API_KEY"):
+        raise SystemExit("OPENAI_API_KEY not set. Run: export OPENAI_API_KEY='...'")
+
+    src_dir = Path(args.src)
+    if not src_dir.exists() or not src_dir.is_dir():
+        raise SystemExit(f"Folder does not exist: {src_dir}")
+
+    files = sorted(src_dir.rglob("*.txt"))
+    if not files:
+        raise SystemExit(f"No .txt files in: {src_dir}")
+
+    lang_slug = args.lang.strip().lower().replace(" ", "_")
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
+
+    job_name = args.job_name or f"{lang_slug}_{timestamp}"
+    job_dir = SCRIPT_DIR / "jobs" / job_name
+    job_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"\n📁 Job directory: {job_dir}")
+
+    client = translate.get_client()
+
+    total_in = 0
+    total_out = 0
+    ok_pages = 0
+    skipped = 0
+    empty = 0
+    failed = 0
+
+    with ThreadPoolExecutor(max_workers=args.workers) as ex:
+        futures = [ex.submit(process_page, client, f, src_dir, job_dir, args) for f in files]
+
+        for fut in as_completed(futures):
+            try:
+                rel, container_count, seg_count, tin, tout, status = fut.result()
+            except Exception as e:
+                failed += 1
+                print(f"FAILED: {e}")
+                continue
+
+            total_in += tin
+            total_out += tout
+
+            if status == "ok":
+                ok_pages += 1
+                print(f"translated {rel} | containers={container_count} segments={seg_count} | in={tin} out={tout}")
+            elif status == "skipped":
+                skipped += 1
+            elif status == "empty":
+                empty += 1
+
+    print(f"done | pages={len(files)} ok={ok_pages} skipped={skipped} empty={empty} failed={failed} total_in={total_in} total_out={total_out}")
+    print(f"\n✔ ALL DONE → {job_dir / 'output'}/")
+
+if __name__ == "__main__":
+    main()
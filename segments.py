@@ -1,8 +1,46 @@
 import argparse
+import os
 import json
-import re
+import fnmatch
 import hashlib
 from pathlib import Path
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    # Optional: google-re2 gives linear-time matching on large containers.
+    import re2 as re
+except ImportError:
+    import re
+
+try:
+    # Optional: orjson encodes straight to UTF-8 bytes, several times faster than json.
+    import orjson
+except ImportError:
+    orjson = None
+
+def load_json(data: bytes):
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def read_json(path: Path):
+    return load_json(path.read_bytes())
+
+def dump_json(payload, pretty: bool = False) -> bytes:
+    # Stage JSON is machine-read, so it is compact unless pretty is asked for.
+    # Both branches give the same bytes: UTF-8, no trailing newline.
+    if orjson:
+        return orjson.dumps(payload, option=orjson.OPT_INDENT_2 if pretty else None)
+    if pretty:
+        return json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def write_json(path: Path, payload, pretty: bool = False):
+    path.write_bytes(dump_json(payload, pretty))
+
+def is_pretty_json(path: Path) -> bool:
+    # Indented output always opens with "{" and a newline; compact output never does.
+    with open(path, "rb") as f:
+        return f.read(2) == b"{\n"
 
 BODY_TAGS = [
     "fusion_title",
@@ -13,54 +51,87 @@ BODY_TAGS = [
     "fusion_table",
 ]
 
-BODY_RX = re.compile(
-    r"\[(?P<tag>" + "|".join(BODY_TAGS) + r")\b[^\]]*\](?P<body>[\s\S]*?)\[/\1\]",
-    re.MULTILINE,
-)
+TOGGLE_TAG = "fusion_toggle"
 
-TOGGLE_RX = re.compile(
-    r"\[fusion_toggle\b(?P<attrs>[^\]]*)\](?P<body>[\s\S]*?)\[/fusion_toggle\]",
-    re.MULTILINE,
-)
+# Opening tags only; each closing tag is found with str.find, so one left-to-right
+# scan covers body tags and toggles without lazy [\s\S]*? bodies.
+# Groups are addressed by number because re2 match objects reject names in start()/end().
+OPEN_TAG_RX = re.compile(r"\[(" + "|".join(BODY_TAGS + [TOGGLE_TAG]) + r")\b([^\]]*)\]")
 
 TITLE_ATTR_RX = re.compile(r'\btitle="([^"]*)"')
 
+TOGGLE_BLOCK_RX = re.compile(r"\[fusion_toggle\b[^\]]*\][\s\S]*?\[/fusion_toggle\]")
+
 SKIP_IF_CONTAINS = [
     "<script",
     "application/ld+json",
 ]
 
+# Bump whenever stable_id changes, so stale translated JSON is rejected on apply.
+HASH_VERSION = 2
+
 def stable_id(source_key: str, kind: str, idx: int, start: int, end: int, text: str):
-    h = hashlib.sha1()
-    h.update((source_key + "|" + kind + "|" + str(idx) + "|" + str(start) + "|" + str(end)).encode("utf-8"))
-    h.update(text.encode("utf-8"))
-    return h.hexdigest()[:16]
+    # One encode and one hash call; same bytes as hashing the key and text separately.
+    data = f"{source_key}|{kind}|{idx}|{start}|{end}{text}".encode("utf-8")
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
 
 def should_skip(text: str):
     t = (text or "").lower()
     return any(x in t for x in SKIP_IF_CONTAINS)
 
+def scan_tags(text: str):
+    # Returns body tag hits as (tag, start, end) and toggle hits as (attrs, start, end),
+    # start/end bounding the tag body. Body tags don't nest into each other and neither
+    # do toggles, but the two kinds are tracked separately, so a body tag inside a
+    # toggle (or the reverse) is still found.
+    body_hits = []
+    toggle_hits = []
+    body_pos = 0
+    toggle_pos = 0
+
+    for m in OPEN_TAG_RX.finditer(text):
+        tag = m.group(1)
+        is_toggle = tag == TOGGLE_TAG
+        if m.start() < (toggle_pos if is_toggle else body_pos):
+            continue
+
+        close = "[/" + tag + "]"
+        end = text.find(close, m.end())
+        if end < 0:
+            continue
+
+        if is_toggle:
+            toggle_hits.append((m.group(2), m.end(), end))
+            toggle_pos = end + len(close)
+        else:
+            body_hits.append((tag, m.end(), end))
+            body_pos = end + len(close)
+
+    return body_hits, toggle_hits
+
 def extract_segments(text: str, source_key: str):
     segments = []
     idx = 0
 
-    for m in BODY_RX.finditer(text):
-        body = m.group("body")
+    body_hits, toggle_hits = scan_tags(text)
+
+    # ids depend on idx, so body tags are numbered before toggles as they always were.
+    for tag, start, end in body_hits:
+        body = text[start:end]
         if should_skip(body):
             continue
         segments.append({
-            "id": stable_id(source_key, m.group("tag"), idx, m.start("body"), m.end("body"), body),
-            "kind": m.group("tag"),
-            "start": m.start("body"),
-            "end": m.end("body"),
+            "id": stable_id(source_key, tag, idx, start, end, body),
+            "kind": tag,
+            "start": start,
+            "end": end,
             "text": body,
         })
         idx += 1
 
     toggle_order = 0
-    for m in TOGGLE_RX.finditer(text):
-        attrs = m.group("attrs") or ""
-        body = m.group("body") or ""
+    for attrs, start, end in toggle_hits:
+        body = text[start:end]
 
         title_m = TITLE_ATTR_RX.search(attrs)
         if title_m:
@@ -76,10 +147,10 @@ def extract_segments(text: str, source_key: str):
 
         if body.strip() and not should_skip(body):
             segments.append({
-                "id": stable_id(source_key, "fusion_toggle:body", idx, m.start("body"), m.end("body"), body),
+                "id": stable_id(source_key, "fusion_toggle:body", idx, start, end, body),
                 "kind": "fusion_toggle:body",
-                "start": m.start("body"),
-                "end": m.end("body"),
+                "start": start,
+                "end": end,
                 "toggle_order": toggle_order,
                 "text": body,
             })
@@ -97,13 +168,140 @@ def replace_toggle_title(block: str, new_title: str):
         return TITLE_ATTR_RX.sub(repl, block, count=1)
     return block
 
+def splice(text: str, edits) -> str:
+    # edits: (start, end, replacement) sorted by start. Builds the result in one
+    # pass; an edit nested inside an already applied one is dropped (outer wins).
+    parts = []
+    pos = 0
+    for start, end, new_text in edits:
+        if start < pos:
+            continue
+        parts.append(text[pos:start])
+        parts.append(new_text)
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts)
+
+def apply_translations(raw: str, segs, tr_map, source_key: str) -> str:
+    span_segs = [s for s in segs if s.get("start") is not None and s.get("end") is not None]
+    title_segs = [s for s in segs if s["kind"] == "fusion_toggle:title"]
+
+    span_segs.sort(key=lambda s: (s["start"], -s["end"]))
+    out = splice(raw, [(s["start"], s["end"], tr_map[s["id"]].get("text", "")) for s in span_segs])
+
+    if not title_segs:
+        return out
+
+    blocks = list(TOGGLE_BLOCK_RX.finditer(out))
+    if not blocks:
+        raise ValueError(f"{source_key}: toggle block not found for title replacement")
+
+    new_titles = {}
+    for s in title_segs:
+        order = min(s.get("toggle_order", 0), len(blocks) - 1)
+        new_titles[order] = tr_map[s["id"]].get("text", "")
+
+    edits = []
+    for order in sorted(new_titles):
+        bm = blocks[order]
+        edits.append((bm.start(), bm.end(), replace_toggle_title(bm.group(0), new_titles[order])))
+
+    return splice(out, edits)
+
+def iter_files(root: Path, pattern: str):
+    # Lazy os.scandir walk in name order. DirEntry caches the entry type, so unlike
+    # rglob there is no extra stat per entry. Symlinked dirs are not followed.
+    # A missing or non-directory root yields nothing, as with rglob.
+    try:
+        with os.scandir(root) as it:
+            entries = sorted(it, key=lambda e: e.name)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_files(Path(entry.path), pattern)
+        elif entry.is_file() and fnmatch.fnmatchcase(entry.name, pattern):
+            yield Path(entry.path)
+
 def iter_container_files(src_dir: Path, pattern: str):
-    return sorted(src_dir.rglob(pattern))
+    return list(iter_files(src_dir, pattern))
 
 def rel_key(src_dir: Path, file_path: Path):
     return file_path.relative_to(src_dir).as_posix()
 
-def cmd_extract(src_dir: str, out_dir: str, pattern: str):
+# Sidecar in each output folder mapping rel key -> hash of the inputs that produced it,
+# so re-runs only redo files whose inputs changed.
+MANIFEST_NAME = ".manifest.json"
+# Entries appended as files finish, folded into the manifest by the next save, so a
+# killed run keeps the files it already wrote.
+MANIFEST_JOURNAL = ".manifest.journal"
+
+def content_hash(*parts: bytes) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part)
+    return h.hexdigest()
+
+def load_manifest(out_dir: Path) -> dict:
+    path = out_dir / MANIFEST_NAME
+    manifest = read_json(path) if path.exists() else {}
+
+    journal = out_dir / MANIFEST_JOURNAL
+    if journal.exists():
+        for line in journal.read_bytes().splitlines():
+            try:
+                key, digest = load_json(line)
+            except (ValueError, TypeError):
+                break  # torn last line from a killed run
+            manifest[key] = digest
+    return manifest
+
+def journal_manifest(out_dir: Path, key: str, digest: str):
+    with open(out_dir / MANIFEST_JOURNAL, "ab") as f:
+        f.write(dump_json([key, digest]) + b"\n")
+
+def save_manifest(out_dir: Path, manifest: dict):
+    # Write then rename, so an interrupted run never leaves a torn manifest. The
+    # journal is only dropped once its entries are safely in the manifest.
+    tmp = out_dir / (MANIFEST_NAME + ".tmp")
+    write_json(tmp, manifest)
+    os.replace(tmp, out_dir / MANIFEST_NAME)
+    (out_dir / MANIFEST_JOURNAL).unlink(missing_ok=True)
+
+SEGMENT_FIELDS = ("id", "kind", "start", "end", "toggle_order", "text")
+
+def extracted_payload(source_key: str, segs):
+    # Offsets are kept so apply can splice without re-scanning the container.
+    return {
+        "source_key": source_key,
+        "hash_version": HASH_VERSION,
+        "segments": [{k: s[k] for k in SEGMENT_FIELDS if k in s} for s in segs],
+    }
+
+def extract_file(p: Path, src_dir: Path, out_dir: Path, pretty: bool = False, prev_hash: str = None):
+    source_key = rel_key(src_dir, p)
+    raw = p.read_text(encoding="utf-8")
+    out_path = (out_dir / p.relative_to(src_dir)).with_suffix(".json")
+
+    # The id scheme version and output format are hashed in, so bumping HASH_VERSION
+    # or switching --pretty rewrites everything.
+    digest = content_hash(
+        str(HASH_VERSION).encode("utf-8"),
+        b"pretty" if pretty else b"compact",
+        raw.encode("utf-8"),
+    )
+    if digest == prev_hash and out_path.exists():
+        return source_key, digest
+
+    segs = extract_segments(raw, source_key)
+
+    payload = extracted_payload(source_key, segs)
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    write_json(out_path, payload, pretty)
+    return source_key, digest
+
+def cmd_extract(src_dir: str, out_dir: str, pattern: str, pretty: bool = False):
     src_dir = Path(src_dir)
     out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
@@ -112,89 +310,89 @@ def cmd_extract(src_dir: str, out_dir: str, pattern: str):
     if not files:
         raise SystemExit(f"No files matching pattern '{pattern}' in: {src_dir}")
 
-    for p in files:
-        source_key = rel_key(src_dir, p)
-        raw = p.read_text(encoding="utf-8")
-        segs = extract_segments(raw, source_key)
+    manifest = load_manifest(out_dir)
+    prev = [manifest.get(rel_key(src_dir, p)) for p in files]
 
-        payload = {
-            "source_key": source_key,
-            "segments": [{"id": s["id"], "kind": s["kind"], "text": s["text"]} for s in segs],
-        }
+    with ProcessPoolExecutor() as ex:
+        results = list(ex.map(
+            extract_file, files, repeat(src_dir), repeat(out_dir), repeat(pretty), prev,
+            chunksize=32,
+        ))
 
-        out_path = (out_dir / p.relative_to(src_dir)).with_suffix(".json")
-        out_path.parent.mkdir(parents=True, exist_ok=True)
-        out_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    # Merged into the loaded manifest, so a narrower --pattern keeps other entries.
+    manifest.update(results)
+    save_manifest(out_dir, manifest)
 
-def cmd_apply(src_dir: str, extracted_dir: str, translated_dir: str, out_dir: str, pattern: str):
-    src_dir = Path(src_dir)
-    extracted_dir = Path(extracted_dir)
-    translated_dir = Path(translated_dir)
-    out_dir = Path(out_dir)
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    files = iter_container_files(src_dir, pattern)
-    if not files:
-        raise SystemExit(f"No files matching pattern '{pattern}' in: {src_dir}")
-
-    toggle_block_rx = re.compile(r"\[fusion_toggle\b[^\]]*\][\s\S]*?\[/fusion_toggle\]", re.MULTILINE)
+def apply_file(p: Path, src_dir: Path, extracted_dir: Path, translated_dir: Path, out_dir: Path, prev_hash: str = None):
+    rel = p.relative_to(src_dir)
+    source_key = rel.as_posix()
 
-    for p in files:
-        rel = p.relative_to(src_dir)
-        source_key = rel.as_posix()
+    extracted_path = (extracted_dir / rel).with_suffix(".json")
+    translated_path = (translated_dir / rel).with_suffix(".json")
 
-        extracted_path = (extracted_dir / rel).with_suffix(".json")
-        translated_path = (translated_dir / rel).with_suffix(".json")
+    if not extracted_path.exists():
+        raise FileNotFoundError(f"Missing extracted file: {extracted_path}")
+    if not translated_path.exists():
+        raise FileNotFoundError(f"Missing translated file: {translated_path}")
 
-        if not extracted_path.exists():
-            raise FileNotFoundError(f"Missing extracted file: {extracted_path}")
-        if not translated_path.exists():
-            raise FileNotFoundError(f"Missing translated file: {translated_path}")
+    raw = p.read_text(encoding="utf-8")
+    extracted_bytes = extracted_path.read_bytes()
+    translated_bytes = translated_path.read_bytes()
 
-        raw = p.read_text(encoding="utf-8")
+    out_path = out_dir / rel
+    digest = content_hash(raw.encode("utf-8"), extracted_bytes, translated_bytes)
+    if digest == prev_hash and out_path.exists():
+        return source_key, digest
 
-        extracted = json.loads(extracted_path.read_text(encoding="utf-8"))
-        translated = json.loads(translated_path.read_text(encoding="utf-8"))
+    extracted = load_json(extracted_bytes)
+    translated = load_json(translated_bytes)
 
-        ex_map = {s["id"]: s for s in extracted.get("segments", [])}
-        tr_map = {s["id"]: s for s in translated.get("segments", [])}
+    if extracted.get("hash_version") != HASH_VERSION:
+        raise ValueError(f"{source_key}: extracted with an older segment id scheme, re-run segments.py extract")
+    if translated.get("hash_version") != HASH_VERSION:
+        raise ValueError(f"{source_key}: translated with an older segment id scheme, re-run translate.py --overwrite")
 
-        missing = [sid for sid in ex_map.keys() if sid not in tr_map]
-        if missing:
-            raise ValueError(f"{source_key}: Missing translated segment IDs: {missing[:5]}")
+    segs = extracted.get("segments", [])
+    tr_map = {s["id"]: s for s in translated.get("segments", [])}
 
-        segs = extract_segments(raw, source_key)
+    missing = [s["id"] for s in segs if s["id"] not in tr_map]
+    if missing:
+        raise ValueError(f"{source_key}: Missing translated segment IDs: {missing[:5]}")
 
-        span_segs = [s for s in segs if s.get("start") is not None and s.get("end") is not None]
-        title_segs = [s for s in segs if s["kind"] == "fusion_toggle:title"]
+    for s in segs:
+        if "start" in s and raw[s["start"]:s["end"]] != s["text"]:
+            raise ValueError(f"{source_key}: container changed since extract, re-run segments.py extract")
 
-        out = raw
+    out = apply_translations(raw, segs, tr_map, source_key)
 
-        for s in reversed(span_segs):
-            sid = s["id"]
-            new_text = tr_map[sid].get("text", "")
-            out = out[:s["start"]] + new_text + out[s["end"]:]
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(out, encoding="utf-8")
+    return source_key, digest
 
-        for s in title_segs:
-            sid = s["id"]
-            new_text = tr_map[sid].get("text", "")
+def cmd_apply(src_dir: str, extracted_dir: str, translated_dir: str, out_dir: str, pattern: str):
+    src_dir = Path(src_dir)
+    extracted_dir = Path(extracted_dir)
+    translated_dir = Path(translated_dir)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
 
-            blocks = list(toggle_block_rx.finditer(out))
-            if not blocks:
-                raise ValueError(f"{source_key}: toggle block not found for title replacement")
+    files = iter_container_files(src_dir, pattern)
+    if not files:
+        raise SystemExit(f"No files matching pattern '{pattern}' in: {src_dir}")
 
-            order = s.get("toggle_order", 0)
-            if order >= len(blocks):
-                order = len(blocks) - 1
+    manifest = load_manifest(out_dir)
+    prev = [manifest.get(rel_key(src_dir, p)) for p in files]
 
-            bm = blocks[order]
-            block = bm.group(0)
-            new_block = replace_toggle_title(block, new_text)
-            out = out[:bm.start()] + new_block + out[bm.end():]
+    with ProcessPoolExecutor() as ex:
+        results = list(ex.map(
+            apply_file, files,
+            repeat(src_dir), repeat(extracted_dir), repeat(translated_dir), repeat(out_dir), prev,
+            chunksize=32,
+        ))
 
-        out_path = out_dir / rel
-        out_path.parent.mkdir(parents=True, exist_ok=True)
-        out_path.write_text(out, encoding="utf-8")
+    # Merged into the loaded manifest, so a narrower --pattern keeps other entries.
+    manifest.update(results)
+    save_manifest(out_dir, manifest)
 
 def main():
     ap = argparse.ArgumentParser()
@@ -204,6 +402,7 @@ def main():
     ap_e.add_argument("--src", required=True, help="Source folder with container .txt files")
     ap_e.add_argument("--out", default="extracted", help="Output folder for JSON files")
     ap_e.add_argument("--pattern", default="container_*.txt")
+    ap_e.add_argument("--pretty", action="store_true", help="Indent JSON output for reading")
 
     ap_a = sub.add_parser("apply", help="Apply translations back to containers")
     ap_a.add_argument("--src", required=True, help="Source folder with container .txt files")
@@ -215,7 +414,7 @@ def main():
     args = ap.parse_args()
 
     if args.cmd == "extract":
-        cmd_extract(args.src, args.out, args.pattern)
+        cmd_extract(args.src, args.out, args.pattern, args.pretty)
     elif args.cmd == "apply":
         cmd_apply(args.src, args.extracted, args.translated, args.out, args.pattern)
 
@@ -2,21 +2,43 @@ import argparse
 import json
 import os
 import time
+import asyncio
 import re
 from pathlib import Path
+from functools import lru_cache
 from typing import List, Tuple, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from pydantic import BaseModel
-from openai import OpenAI
+from pydantic import BaseModel, ConfigDict
+from openai import OpenAI, AsyncOpenAI
+
+from segments import (
+    content_hash, dump_json, is_pretty_json, iter_files, journal_manifest, load_json, load_manifest,
+    save_manifest, write_json,
+)
 
 class Segment(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
     id: str
     text: str
 
 class TranslationPayload(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
     segments: List[Segment]
 
+# The models only define the structured-output schema, built once here. The API
+# enforces it server-side, so responses are decoded straight to dicts without
+# building and dumping pydantic instances.
+TEXT_FORMAT = {
+    "format": {
+        "type": "json_schema",
+        "name": "TranslationPayload",
+        "schema": TranslationPayload.model_json_schema(),
+        "strict": True,
+    }
+}
+
 BRACKET_RX = re.compile(r"\[[^\]]*?\]")
 BAD_TOKENS = ["on_toggle]", "off_toggle]"]
 
@@ -24,6 +46,7 @@ def chunk_list(items, size):
     for i in range(0, len(items), size):
         yield items[i:i + size]
 
+@lru_cache(maxsize=8)
 def build_system_prompt(target_lang: str) -> str:
     return (
         f"You are a strict localization engine. Translate to {target_lang}. "
@@ -46,27 +69,43 @@ def is_corrupt(original_text: str, translated_text: str) -> bool:
         return True
     return False
 
+def build_input(target_lang: str, segments: List[dict]) -> List[dict]:
+    payload = {"segments": [{"id": s["id"], "text": s["text"]} for s in segments]}
+    return [
+        {"role": "system", "content": build_system_prompt(target_lang)},
+        {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
+    ]
+
+def check_translation(segments: List[dict], translated: dict):
+    if "segments" not in translated or len(translated["segments"]) != len(segments):
+        raise ValueError("Schema mismatch: segment count differs")
+
+    # Callers pair results with their input by position, so order must be kept too.
+    for s, t in zip(segments, translated["segments"]):
+        if s["id"] != t["id"]:
+            raise ValueError("Schema mismatch: ids missing or reordered in translated output")
+
+    bad = []
+    for s, t in zip(segments, translated["segments"]):
+        if is_corrupt(s.get("text", ""), t["text"]):
+            bad.append(s["id"])
+
+    if bad:
+        raise ValueError(f"Shortcode corruption detected (ids: {bad[:5]})")
+
 def translate_segments_once(
     client: OpenAI,
     model: str,
     target_lang: str,
     segments: List[dict],
 ) -> Tuple[dict, Optional[object]]:
-    payload = {"segments": [{"id": s["id"], "text": s["text"]} for s in segments]}
-    sys_prompt = build_system_prompt(target_lang)
-    user = json.dumps(payload, ensure_ascii=False)
-
-    resp = client.responses.parse(
+    resp = client.responses.create(
         model=model,
-        input=[
-            {"role": "system", "content": sys_prompt},
-            {"role": "user", "content": user},
-        ],
-        text_format=TranslationPayload,
+        input=build_input(target_lang, segments),
+        text=TEXT_FORMAT,
     )
-    parsed = resp.output_parsed
     usage = getattr(resp, "usage", None)
-    return parsed.model_dump(), usage
+    return load_json(resp.output_text), usage
 
 def translate_segments(
     client: OpenAI,
@@ -80,98 +119,62 @@ def translate_segments(
     for attempt in range(max_retries):
         try:
             translated, usage = translate_segments_once(client, model, target_lang, segments)
-            if "segments" not in translated or len(translated["segments"]) != len(segments):
-                raise ValueError("Schema mismatch: segment count differs")
-
-            tr_map = {s["id"]: s["text"] for s in translated["segments"]}
-            for s in segments:
-                if s["id"] not in tr_map:
-                    raise ValueError("Schema mismatch: missing id in translated output")
-
-            bad = []
-            for s in segments:
-                o = s.get("text", "")
-                t = tr_map[s["id"]]
-                if is_corrupt(o, t):
-                    bad.append(s["id"])
-
-            if bad:
-                raise ValueError(f"Shortcode corruption detected (ids: {bad[:5]})")
-
+            check_translation(segments, translated)
             return translated, usage
         except Exception as e:
             last_err = e
             time.sleep(sleep_base * (2 ** attempt))
     raise last_err
 
-def translate_file(
-    in_path: Path,
-    in_dir: Path,
-    out_dir: Path,
+async def translate_segments_once_async(
+    client: AsyncOpenAI,
     model: str,
-    lang: str,
-    batch: int,
+    target_lang: str,
+    segments: List[dict],
+) -> Tuple[dict, Optional[object]]:
+    resp = await client.responses.create(
+        model=model,
+        input=build_input(target_lang, segments),
+        text=TEXT_FORMAT,
+    )
+    usage = getattr(resp, "usage", None)
+    return load_json(resp.output_text), usage
+
+async def translate_segments_async(
+    client: AsyncOpenAI,
+    model: str,
+    target_lang: str,
+    segments: List[dict],
     max_retries: int,
     sleep_base: float,
-    overwrite: bool,
-) -> Tuple[str, int, int, int, str]:
-    rel = in_path.relative_to(in_dir)
-    out_path = out_dir / rel
-
-    if out_path.exists() and not overwrite:
-        return (str(rel), 0, 0, 0, "skipped")
-
-    data = json.loads(in_path.read_text(encoding="utf-8"))
-    segments = data.get("segments", [])
-
-    if not segments:
-        out_path.parent.mkdir(parents=True, exist_ok=True)
-        result = {
-            "source_key": data.get("source_key", str(rel).replace("\\", "/")),
-            "segments": [],
-        }
-        out_path.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
-        return (str(rel), 0, 0, 0, "empty")
-
-    client = OpenAI()
-
-    translated_segments = []
-    file_in = 0
-    file_out = 0
-
-    for group in chunk_list(segments, batch):
-        translated, usage = translate_segments(
-            client=client,
-            model=model,
-            target_lang=lang,
-            segments=group,
-            max_retries=max_retries,
-            sleep_base=sleep_base,
-        )
-
-        out_map = {s["id"]: s["text"] for s in translated["segments"]}
-        for s in group:
-            translated_segments.append({
-                "id": s["id"],
-                "kind": s.get("kind", ""),
-                "text": out_map[s["id"]],
-            })
-
-        if usage:
-            file_in += int(getattr(usage, "input_tokens", 0) or 0)
-            file_out += int(getattr(usage, "output_tokens", 0) or 0)
+) -> Tuple[dict, Optional[object]]:
+    last_err = None
+    for attempt in range(max_retries):
+        try:
+            translated, usage = await translate_segments_once_async(client, model, target_lang, segments)
+            check_translation(segments, translated)
+            return translated, usage
+        except Exception as e:
+            last_err = e
+            await asyncio.sleep(sleep_base * (2 ** attempt))
+    raise last_err
+
+@lru_cache(maxsize=None)
+def get_client() -> OpenAI:
+    # One client per process: it is thread-safe and pools HTTP connections.
+    return OpenAI()
 
+def write_result(out_path: Path, rel: Path, data: dict, translated_segments: List[dict], pretty: bool = False):
     result = {
         "source_key": data.get("source_key", str(rel).replace("\\", "/")),
+        "hash_version": data.get("hash_version"),
         "segments": translated_segments,
     }
 
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json(out_path, result, pretty)
 
-    return (str(rel), len(segments), file_in, file_out, "ok")
-
-def main():
+def build_parser() -> argparse.ArgumentParser:
     ap = argparse.ArgumentParser()
     ap.add_argument("--in", dest="in_dir", default="extracted", help="Input folder with JSON files")
     ap.add_argument("--out", dest="out_dir", default="translated", help="Output folder for translated JSON")
@@ -183,8 +186,10 @@ def main():
     ap.add_argument("--sleep-base", type=float, default=0.2)
     ap.add_argument("--overwrite", action="store_true")
     ap.add_argument("--workers", type=int, default=8)
-    args = ap.parse_args()
+    ap.add_argument("--pretty", action="store_true", help="Indent JSON output for reading")
+    return ap
 
+async def run_async(args: argparse.Namespace):
     if not os.getenv("OPENAI_API_KEY"):
         raise SystemExit("OPENAI_API_KEY not set. Run: export OPENAI_API_KEY='...'")
 
@@ -192,10 +197,6 @@ def main():
     out_dir = Path(args.out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    paths = sorted(in_dir.rglob(args.pattern))
-    if not paths:
-        raise SystemExit(f"No input files found in {in_dir} with pattern {args.pattern}")
-
     total_in = 0
     total_out = 0
     total_files = 0
@@ -204,38 +205,141 @@ def main():
     empty = 0
     failed = 0
 
-    with ThreadPoolExecutor(max_workers=args.workers) as ex:
-        futures = [
-            ex.submit(
-                translate_file,
-                p, in_dir, out_dir,
-                args.model, args.lang, args.batch,
-                args.max_retries, args.sleep_base, args.overwrite
-            )
-            for p in paths
-        ]
-
-        for fut in as_completed(futures):
-            try:
-                rel, seg_count, tin, tout, status = fut.result()
-            except Exception as e:
-                failed += 1
-                print(f"FAILED: {e}")
-                continue
+    # A file is only skipped when its input JSON is unchanged since the run that
+    # produced its output. Entries are updated for files written in this run and
+    # dropped for files that fail; entries for files outside --pattern are kept.
+    # The parsed input is hashed, not the raw bytes, so reformatting extracted/
+    # (--pretty) never triggers a paid re-translation.
+    manifest = load_manifest(out_dir)
+
+    # (rel, out_path, data, digest) for every file that still needs translating.
+    # Input files are read as the directory walk yields them.
+    files = []
+    for p in iter_files(in_dir, args.pattern):
+        rel = p.relative_to(in_dir)
+        out_path = out_dir / rel
+        data = load_json(p.read_bytes())
+        digest = content_hash(dump_json(data))
+
+        if out_path.exists() and not args.overwrite and manifest.get(rel.as_posix()) == digest:
+            # Only the output format changed: rewrite it from itself, no API call.
+            if is_pretty_json(out_path) != args.pretty:
+                write_json(out_path, load_json(out_path.read_bytes()), args.pretty)
+            total_files += 1
+            skipped += 1
+            continue
 
+        if not data.get("segments"):
+            write_result(out_path, rel, data, [], args.pretty)
+            manifest[rel.as_posix()] = digest
+            journal_manifest(out_dir, rel.as_posix(), digest)
             total_files += 1
-            total_in += tin
-            total_out += tout
+            empty += 1
+            continue
+
+        files.append((rel, out_path, data, digest))
 
-            if status == "ok":
+    if not files and not total_files:
+        raise SystemExit(f"No input files found in {in_dir} with pattern {args.pattern}")
+
+    # Identical texts are sent once per job (boilerplate like buttons and CTAs
+    # repeats across pages). Each unique entry is (first segment, occurrences),
+    # every occurrence being the (file, position) its translation is copied to.
+    uniques = []
+    first_seen = {}
+    for fi, (_, _, data, _) in enumerate(files):
+        for si, s in enumerate(data["segments"]):
+            ui = first_seen.get(s["text"])
+            if ui is None:
+                ui = first_seen[s["text"]] = len(uniques)
+                uniques.append((s, []))
+            uniques[ui][1].append((fi, si))
+
+    # Unique segments from all files are packed into full-size batches.
+    batches = list(chunk_list(uniques, args.batch))
+    if uniques:
+        print(f"segments={sum(len(occ) for _, occ in uniques)} unique={len(uniques)} batches={len(batches)}")
+
+    def batch_files(group):
+        return sorted({fi for _, occ in group for fi, _ in occ})
+
+    pending = [0] * len(files)
+    for group in batches:
+        for fi in batch_files(group):
+            pending[fi] += 1
+
+    # Each result is written straight into its slot, so the extracted order
+    # survives batches finishing out of order.
+    translated_by_file = [[None] * len(data["segments"]) for _, _, data, _ in files]
+    failed_files = set()
+    # One event loop keeps up to --workers requests in flight; the semaphore
+    # replaces the thread pool as the concurrency limit.
+    sem = asyncio.Semaphore(args.workers)
+
+    async with AsyncOpenAI() as client:
+        async def run_batch(group):
+            async with sem:
+                try:
+                    result = await translate_segments_async(
+                        client, args.model, args.lang,
+                        [s for s, _ in group],
+                        args.max_retries, args.sleep_base,
+                    )
+                except Exception as e:
+                    return group, None, e
+            return group, result, None
+
+        for next_done in asyncio.as_completed([run_batch(group) for group in batches]):
+            group, result, err = await next_done
+            file_ids = batch_files(group)
+
+            if err is not None:
+                print(f"FAILED: {err}")
+                failed_files.update(file_ids)
+            else:
+                translated, usage = result
+                for (_, occ), t in zip(group, translated["segments"]):
+                    for fi, si in occ:
+                        s = files[fi][2]["segments"][si]
+                        translated_by_file[fi][si] = {
+                            "id": s["id"],
+                            "kind": s.get("kind", ""),
+                            "text": t["text"],
+                        }
+
+                if usage:
+                    total_in += int(getattr(usage, "input_tokens", 0) or 0)
+                    total_out += int(getattr(usage, "output_tokens", 0) or 0)
+
+            for fi in file_ids:
+                pending[fi] -= 1
+                if pending[fi]:
+                    continue
+
+                rel, out_path, data, digest = files[fi]
+                if fi in failed_files:
+                    manifest.pop(rel.as_posix(), None)
+                    failed += 1
+                    print(f"FAILED: {rel}")
+                    continue
+
+                write_result(out_path, rel, data, translated_by_file[fi], args.pretty)
+                manifest[rel.as_posix()] = digest
+                # Journaled right away, so an interrupted run still leaves this file to be skipped.
+                journal_manifest(out_dir, rel.as_posix(), digest)
+
+                total_files += 1
                 ok_files += 1
-                print(f"translated {rel} | segments={seg_count} | in={tin} out={tout}")
-            elif status == "skipped":
-                skipped += 1
-            elif status == "empty":
-                empty += 1
+                print(f"translated {rel} | segments={len(data['segments'])}")
 
+    save_manifest(out_dir, manifest)
     print(f"done | files={total_files} ok={ok_files} skipped={skipped} empty={empty} failed={failed} total_in={total_in} total_out={total_out}")
 
+def run(args: argparse.Namespace):
+    asyncio.run(run_async(args))
+
+def main():
+    run(build_parser().parse_args())
+
 if __name__ == "__main__":
     main()